@@ -1,10 +1,16 @@
 import streamlit as st
 import trimesh
 import numpy as np
-import matplotlib.pyplot as plt
-import tempfile
+import pandas as pd
+import io
 import os
-from area_calculator import get_area_distribution
+import stat
+import contextlib
+import hashlib
+import tempfile
+import threading
+import collections
+from area_calculator import iter_all_axes, orient_shells
 
 # Unit name mapping
 UNIT_NAMES = {
@@ -16,8 +22,212 @@ UNIT_NAMES = {
     "m": "meters"
 }
 
+# Parsed triangle arrays are saved here, keyed on the uploaded file's content.
+# The temp directory is shared between users on POSIX, so each user gets
+# their own cache directory there.
+CACHE_DIR = os.path.join(tempfile.gettempdir(),
+                         f"sec_area_cache-{os.getuid()}" if hasattr(os, 'getuid') else "sec_area_cache")
+# Least recently used arrays are deleted once the cache grows past this size
+CACHE_MAX_BYTES = 2 * 1024**3
+# Part of every cached file name. Bump it whenever parse_stl changes the
+# triangles it returns, so arrays saved by older versions aren't served.
+CACHE_FORMAT = 1
+
 st.set_page_config(page_title="Sectional Area Calculator", layout="wide")
 
+class _MeshShim:
+    """The parts of a mesh that slicing uses, built from its triangle array."""
+    def __init__(self, triangles):
+        self.triangles = triangles
+        vertices = triangles.reshape(-1, 3)
+        self.bounds = np.array([vertices.min(axis=0), vertices.max(axis=0)])
+
+def parse_stl(file_bytes):
+    """Parses an uploaded STL and returns its (n, 3, 3) triangle array."""
+    # Load straight from memory
+    mesh = trimesh.load(io.BytesIO(file_bytes), file_type='stl', process=False)
+
+    # If the file contains multiple objects, combine them into one mesh.
+    # dump() places every instance with its node transform. A scene holding a
+    # single untransformed instance is used as is, which avoids copying all
+    # of its arrays.
+    if isinstance(mesh, trimesh.Scene):
+        nodes = mesh.graph.nodes_geometry
+        if len(nodes) == 1 and np.allclose(mesh.graph[nodes[0]][0], np.eye(4)):
+            mesh = mesh.geometry[mesh.graph[nodes[0]][1]]
+        else:
+            mesh = trimesh.util.concatenate(mesh.dump())
+
+    # Loading skips trimesh's processing, which leaves every face with its own
+    # copy of its vertices. Merge them so neighbouring faces share edges again.
+    # Merging costs about as much as that processing did, and orienting the
+    # shells adds roughly two thirds on top, so a load is slower than a plain
+    # processed load. It is paid once per file.
+    mesh.merge_vertices()
+
+    # The areas are summed from signed outline segments, so flipped faces,
+    # inside-out bodies and void walls must be oriented consistently
+    orient_shells(mesh)
+
+    return mesh.triangles
+
+def _cache_dir():
+    """
+    Returns the triangle cache directory, created so only this user can use
+    it, or None if it can't be created or isn't safe to trust.
+    """
+    try:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(CACHE_DIR)
+    except OSError:
+        return None
+
+    # Refuse a symlink, or a directory someone else created or can access
+    if not stat.S_ISDIR(info.st_mode):
+        return None
+    if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        return None
+    return CACHE_DIR
+
+def _load_cached(cache_path):
+    """Memory-maps a cached triangle array, or returns None if there isn't a usable one."""
+    try:
+        triangles = np.load(cache_path, mmap_mode='r')
+        # Mark it as recently used so pruning keeps it
+        os.utime(cache_path)
+    except (OSError, ValueError):
+        return None
+    return triangles
+
+def _save_cached(cache_dir, cache_path, triangles):
+    """
+    Saves a triangle array to the cache, then prunes the cache. The cache is
+    only an optimisation, so failures such as a full disk are ignored.
+    """
+    # Write to a temporary file first so no one can load a partial array
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            np.save(f, triangles)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        return
+
+    _prune_cache(cache_dir)
+
+def _prune_cache(cache_dir):
+    """
+    Deletes arrays saved in other cache formats, then the least recently used
+    arrays until the cache fits in CACHE_MAX_BYTES.
+    """
+    try:
+        with os.scandir(cache_dir) as entries:
+            names = [entry.name for entry in entries if entry.name.endswith('.npy')]
+    except OSError:
+        return
+
+    current = []
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        # A file that vanished or can't be removed (on Windows, while it is
+        # still memory-mapped) is skipped without stopping the rest
+        try:
+            if name.endswith(f".v{CACHE_FORMAT}.npy"):
+                info = os.stat(path)
+                current.append((info.st_mtime, info.st_size, path))
+            else:
+                os.remove(path)
+        except OSError:
+            continue
+
+    # The newest array is always kept, even if it alone is over the limit
+    current.sort(reverse=True)
+    total = 0
+    for i, (_, size, path) in enumerate(current):
+        total += size
+        if i > 0 and total > CACHE_MAX_BYTES:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+# Loaded meshes are shared by every session, so only the most recent few
+# uploads are kept in memory
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_mesh(file_key, _file_bytes):
+    """
+    Loads an uploaded STL once per distinct file content, keyed on file_key.
+    The triangles are also saved to disk, so later sessions and server restarts
+    memory-map them instead of parsing the STL again.
+    """
+    cache_dir = _cache_dir()
+    if cache_dir is None:
+        return _MeshShim(parse_stl(_file_bytes))
+
+    cache_path = os.path.join(cache_dir, f"{file_key}.v{CACHE_FORMAT}.npy")
+    triangles = _load_cached(cache_path)
+    if triangles is not None:
+        return _MeshShim(triangles)
+
+    triangles = parse_stl(_file_bytes)
+    _save_cached(cache_dir, cache_path, triangles)
+    return _MeshShim(triangles)
+
+# Computed distributions are small, so many more are kept than meshes
+AREA_RESULTS_MAX_ENTRIES = 64
+
+@st.cache_resource(show_spinner=False)
+def shared_area_results():
+    """
+    Area distributions computed by any session, least recently used first,
+    keyed on (file_key, num_slices, single_precision), and their lock.
+    """
+    return collections.OrderedDict(), threading.Lock()
+
+def find_area_results(results_key):
+    """Returns the distributions another run already computed, or None."""
+    results, lock = shared_area_results()
+    with lock:
+        data = results.get(results_key)
+        if data is not None:
+            results.move_to_end(results_key)
+    return data
+
+def store_area_results(results_key, data):
+    """Shares computed distributions with every session."""
+    results, lock = shared_area_results()
+    with lock:
+        results[results_key] = data
+        results.move_to_end(results_key)
+        while len(results) > AREA_RESULTS_MAX_ENTRIES:
+            results.popitem(last=False)
+
+def create_area_charts():
+    """Creates one tab per axis, each holding a placeholder for its chart."""
+    # Create tabs for X, Y, Z
+    tab_x, tab_y, tab_z = st.tabs(["X Axis", "Y Axis", "Z Axis"])
+    
+    axes_config = {
+        'X': tab_x,
+        'Y': tab_y,
+        'Z': tab_z
+    }
+    
+    return {axis_name: tab.empty() for axis_name, tab in axes_config.items()}
+
+def draw_area_charts(charts, data, display_name, unit_name):
+    """Draws the area distribution of each axis into its chart placeholder."""
+    for axis_name, chart in charts.items():
+        locs, areas = data[axis_name]
+        
+        with chart.container():
+            # A native Streamlit chart avoids rasterizing a matplotlib figure on every run
+            st.markdown(f"**Cross-Sectional Area Distribution - {display_name} ({axis_name} Axis)**")
+            st.area_chart(pd.DataFrame({'Area': areas}, index=locs),
+                          x_label=f'Position along {axis_name} Axis ({unit_name})',
+                          y_label=f'Area ({unit_name}²)',
+                          color='#1f77b4')
+
 st.title("Sectional Area Calculator")
 st.markdown("""
 Upload an STL file to calculate and visualize its cross-sectional area distribution along the X, Y, and Z axes.
@@ -26,21 +236,11 @@ Upload an STL file to calculate and visualize its cross-sectional area distribut
 uploaded_file = st.file_uploader("Choose an STL file", type=['stl'])
 
 if uploaded_file is not None:
-    # Save uploaded file to a temporary file because trimesh needs a file path or file object
-    # For robust loading with trimesh (which sometimes needs a path for file type detection), 
-    # we'll save it to a temp file.
-    suffix = '.stl'
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        tmp_file_path = tmp_file.name
-
     try:
         with st.spinner(f"Loading {uploaded_file.name}..."):
-            mesh = trimesh.load(tmp_file_path)
-        
-        # If the file contains multiple objects, combine them into one mesh
-        if isinstance(mesh, trimesh.Scene):
-            mesh = trimesh.util.concatenate(mesh.dump())
+            file_bytes = uploaded_file.getvalue()
+            file_key = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+            mesh = load_mesh(file_key, file_bytes)
 
         st.success(f"Successfully loaded {uploaded_file.name}")
         
@@ -66,48 +266,38 @@ if uploaded_file is not None:
         with col3:
             num_slices = st.slider("Number of Slices", min_value=10, max_value=500, value=100, step=10,
                                    help="More slices = smoother graph but slower processing")
+            single_precision = st.checkbox("Single precision", value=False,
+                                           help="Faster on large models, accurate to about 4 significant figures")
         
-        if st.button("Calculate Area Distribution"):
-            
-            # Create tabs for X, Y, Z
-            tab_x, tab_y, tab_z = st.tabs(["X Axis", "Y Axis", "Z Axis"])
-            
-            axes_config = {
-                'X': ([1, 0, 0], tab_x),
-                'Y': ([0, 1, 0], tab_y),
-                'Z': ([0, 0, 1], tab_z)
-            }
-            
-            progress_bar = st.progress(0)
+        # Results are kept in the session so that reruns from other widgets (such as
+        # changing the units) redraw them instead of dropping them or recomputing
+        results_key = (file_key, num_slices, single_precision)
+        
+        stored_results = st.session_state.get('area_results')
+        has_results = stored_results is not None and stored_results[0] == results_key
+        
+        # Remove .stl extension for display
+        display_name = uploaded_file.name.removesuffix('.stl')
+        
+        if st.button("Calculate Area Distribution") and not has_results:
+            # Any session may already have computed these settings for this file
+            data = find_area_results(results_key)
+            if data is None:
+                # All three axes are sliced together, a run of slices at a time, and
+                # the charts are redrawn after each run so they fill in as it goes
+                progress = st.progress(0.0, text="Analyzing X, Y and Z axes...")
+                charts = create_area_charts()
+                for data in iter_all_axes(mesh, num_slices, single_precision=single_precision):
+                    draw_area_charts(charts, data, display_name, unit_name)
+                    progress.progress(len(data['X'][1]) / num_slices,
+                                      text="Analyzing X, Y and Z axes...")
+                progress.empty()
+                store_area_results(results_key, data)
+            else:
+                draw_area_charts(create_area_charts(), data, display_name, unit_name)
+            st.session_state.area_results = (results_key, data)
+        elif has_results:
+            draw_area_charts(create_area_charts(), stored_results[1], display_name, unit_name)
             
-            for i, (axis_name, (direction, tab)) in enumerate(axes_config.items()):
-                with st.spinner(f"Analyzing {axis_name} axis..."):
-                    locs, areas = get_area_distribution(mesh, direction, num_slices)
-                    
-                    with tab:
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        fig.patch.set_facecolor('white')
-                        ax.set_facecolor('white')
-                        # Remove .stl extension for display
-                        display_name = uploaded_file.name.removesuffix('.stl')
-                        
-                        ax.plot(locs, areas, linestyle='-', color='#1f77b4')
-                        ax.fill_between(locs, areas, alpha=0.3, color='#1f77b4')
-                        ax.set_title(f'Cross-Sectional Area Distribution - {display_name} ({axis_name} Axis)')
-                        ax.set_xlabel(f'Position along {axis_name} Axis ({unit_name})')
-                        ax.set_ylabel(f'Area ({unit_name}²)')
-                        ax.grid(True, alpha=0.3)
-                        
-                        # Remove all spines
-                        for spine in ax.spines.values():
-                            spine.set_visible(False)
-                        st.pyplot(fig)
-                
-                progress_bar.progress((i + 1) / 3)
-                
     except Exception as e:
         st.error(f"Error processing file: {e}")
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(tmp_file_path):
-            os.remove(tmp_file_path)
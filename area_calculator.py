@@ -1,9 +1,19 @@
 import trimesh
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Button
 import sys
 import glob
+import threading
+
+try:
+    from area_calculator_numba import areas_along_axis as _areas_along_axis_numba
+    from area_calculator_numba import areas_all_axes as _areas_all_axes_numba
+except ImportError:
+    _areas_along_axis_numba = None
+    _areas_all_axes_numba = None
+
+# The compiled kernel already uses every core, and numba's default threading
+# layer aborts if parallel kernels are launched from several threads at once
+_numba_lock = threading.Lock()
 
 # --- CONFIGURATION SECTION ---
 # 1. Put the name of your STL file here
@@ -23,50 +33,317 @@ UNIT_NAMES = {
     "m": "meters"
 }
 
-def get_area_distribution(mesh, axis_direction, num_slices):
+# Upper bound on (triangle, slice) pairs the NumPy kernel evaluates at once,
+# which keeps its temporaries to a few hundred MB
+_KERNEL_CHUNK_PAIRS = 1_000_000
+
+def _crossing_runs(triangles, axis_idx, heights):
+    """
+    Returns the first slice crossing each triangle and the number of slices
+    that cross it. heights must be sorted.
+    """
+    # Only the slices with z_min <= h < z_max cross a triangle, and with sorted
+    # heights those form one contiguous run per triangle
+    z = triangles[:, :, axis_idx]
+    first = np.searchsorted(heights, z.min(axis=1))
+    return first, np.searchsorted(heights, z.max(axis=1)) - first
+
+def _chunk_bounds(pair_counts):
+    """
+    Splits consecutive triangles into chunks of at most _KERNEL_CHUNK_PAIRS
+    (triangle, slice) pairs, given the pair count of each triangle. Returns the
+    chunk boundaries as triangle indices, from 0 to the number of triangles.
+    """
+    pairs_before = np.concatenate(([0], np.cumsum(pair_counts)))
+    bounds = [0]
+    while bounds[-1] < len(pair_counts):
+        start = bounds[-1]
+        stop = np.searchsorted(pairs_before, pairs_before[start] + _KERNEL_CHUNK_PAIRS,
+                               side='right') - 1
+        # A triangle with more pairs than the budget gets a chunk of its own
+        bounds.append(max(stop, start + 1))
+    return bounds
+
+def _edge_crossings(vertices, dist, edge, center, u_idx, v_idx):
+    """
+    In-plane points where one chosen edge per (triangle, slice) pair meets the
+    slice plane. vertices and dist are (pairs, 3, 3) and (pairs, 3), and edge k
+    runs from vertex k to the next vertex in winding order.
+    """
+    rows = 3 * np.arange(len(dist))
+    edge_start = rows + edge
+    edge_end = rows + (edge + 1) % 3
+
+    dist_start = np.take(dist, edge_start)
+    t = dist_start / (dist_start - np.take(dist, edge_end))
+
+    flat = vertices.reshape(-1, 3)
+    start = np.take(flat, edge_start, axis=0)
+    end = np.take(flat, edge_end, axis=0)
+    u = start[:, u_idx] + t * (end[:, u_idx] - start[:, u_idx]) - center[u_idx]
+    v = start[:, v_idx] + t * (end[:, v_idx] - start[:, v_idx]) - center[v_idx]
+    return u, v
+
+def _outline_sums(triangles, axis_idx, heights, center, first, counts):
+    """
+    Sums the shoelace terms of the section outline segments that each slice
+    plane cuts from the triangles. Twice the signed area once summed over
+    every triangle of a closed mesh. first and counts are the triangles'
+    crossing runs from _crossing_runs.
+    """
+    # Expand the crossing runs into (triangle, slice) pairs so no work is
+    # spent on slices that miss a triangle
+    tri_idx = np.repeat(np.arange(len(triangles)), counts)
+    run_starts = np.cumsum(counts) - counts
+    slice_idx = first[tri_idx] + np.arange(len(tri_idx)) - run_starts[tri_idx]
+
+    # Signed distance of every vertex from its pair's plane, (pairs, 3)
+    vertices = triangles[tri_idx]
+    dist = vertices[:, :, axis_idx] - heights[slice_idx][:, None]
+    above = dist > 0
+    above_next = np.roll(above, -1, axis=1)
+
+    # Every pair has exactly one edge leaving the region above the plane and
+    # one entering it. On a consistently wound surface the section outline
+    # runs from the first crossing to the second, so only those two edges
+    # are interpolated. (u, v, axis) is right-handed.
+    u_idx = (axis_idx + 1) % 3
+    v_idx = (axis_idx + 2) % 3
+    leaving = np.argmax(above & ~above_next, axis=1)
+    entering = np.argmax(~above & above_next, axis=1)
+    start_u, start_v = _edge_crossings(vertices, dist, leaving, center, u_idx, v_idx)
+    end_u, end_v = _edge_crossings(vertices, dist, entering, center, u_idx, v_idx)
+
+    # Accumulate in double precision even when the triangles are float32
+    return np.bincount(slice_idx, weights=start_u * end_v - start_v * end_u,
+                       minlength=len(heights))
+
+def _areas_along_axis(triangles, axis_idx, heights, out):
+    """
+    Fills out with the cross-sectional areas at the given heights along a
+    coordinate axis, computed from the (n, 3, 3) triangle array of a closed mesh
+    whose faces are wound consistently with outward normals.
+    The heights must be sorted.
+    """
+    center = triangles.reshape(-1, 3).mean(axis=0, dtype=np.float64).astype(triangles.dtype)
+    first, counts = _crossing_runs(triangles, axis_idx, heights)
+    bounds = _chunk_bounds(counts)
+
+    out.fill(0.0)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        out += _outline_sums(triangles[start:stop], axis_idx, heights, center,
+                             first[start:stop], counts[start:stop])
+
+    np.abs(out, out=out)
+    out /= 2
+
+def _areas_all_axes(triangles, heights, out):
+    """
+    Fills out with the cross-sectional areas along X, Y and Z at once. heights
+    and out have one row of sorted slice heights per axis, and each chunk of
+    triangles is read once and used for all three axes while it is still in cache.
+    Like _areas_along_axis, this relies on consistent outward winding.
+    """
+    center = triangles.reshape(-1, 3).mean(axis=0, dtype=np.float64).astype(triangles.dtype)
+    runs = [_crossing_runs(triangles, axis_idx, heights[axis_idx]) for axis_idx in range(3)]
+    bounds = _chunk_bounds(sum(counts for _, counts in runs))
+
+    out.fill(0.0)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        tris = triangles[start:stop]
+        for axis_idx, (first, counts) in enumerate(runs):
+            out[axis_idx] += _outline_sums(tris, axis_idx, heights[axis_idx], center,
+                                           first[start:stop], counts[start:stop])
+
+    np.abs(out, out=out)
+    out /= 2
+
+# Single precision is only used while the model sits within this many model
+# sizes of the origin, so float32 still resolves it to ~4 significant figures
+_FLOAT32_MAX_OFFSET_RATIO = 1e3
+
+def _kernel_arrays(triangles, heights, bounds, max_val, single_precision):
+    """
+    Returns the triangles and slice heights in the precision the area kernels
+    should run at. float32 halves the memory traffic of the kernels. max_val
+    is the model's far end along each row of heights.
+    """
+    if single_precision:
+        size = np.max(bounds[1] - bounds[0])
+        if np.max(np.abs(bounds)) <= _FLOAT32_MAX_OFFSET_RATIO * size:
+            # Away from the origin the end slice inset is below float32
+            # resolution, so rounding can put the last slice on the end face,
+            # where it measures 0. Keep it at least one step inside.
+            last_inside = np.nextafter(np.asarray(max_val, dtype=np.float32), np.float32(-np.inf))
+            return (triangles.astype(np.float32),
+                    np.minimum(heights.astype(np.float32), last_inside))
+    return triangles, heights
+
+# The end slices are inset by this fraction of the model length
+_END_SLICE_INSET = 1e-6
+
+def _slice_locations(min_val, max_val, num_slices):
+    """
+    Evenly spaced slice locations between min_val and max_val (scalars, or one
+    entry per axis for a row of locations per axis). The end slices are inset
+    slightly, so they cut just inside the end faces instead of exactly at the
+    model's boundary, where one end would measure the face and the other 0.
     """
-    Calculates the cross-sectional area distribution along a specific axis.
+    inset = (max_val - min_val) * _END_SLICE_INSET
+    return np.linspace(min_val + inset, max_val - inset, num_slices, axis=-1)
+
+def _shell_winding_numbers(triangles, points):
     """
-    axis_name = "Unknown"
-    if np.array_equal(axis_direction, [1, 0, 0]): axis_name = "X"
-    elif np.array_equal(axis_direction, [0, 1, 0]): axis_name = "Y"
-    elif np.array_equal(axis_direction, [0, 0, 1]): axis_name = "Z"
+    Winding numbers of a closed shell, given as an (n, 3, 3) triangle array,
+    around each of the points: about 1 inside an outward shell, -1 inside an
+    inward one and 0 outside.
+    """
+    # Points are taken in batches so the (points, triangles) temporaries stay
+    # within the same budget as the slicing kernel
+    batch = max(1, _KERNEL_CHUNK_PAIRS // len(triangles))
+    winding = np.empty(len(points))
+    for start in range(0, len(points), batch):
+        # Solid angle of every triangle seen from every point (Van Oosterom
+        # and Strackee), summed over the shell
+        a, b, c = (triangles[None, :, k] - points[start:start + batch, None] for k in range(3))
+        len_a, len_b, len_c = (np.linalg.norm(x, axis=-1) for x in (a, b, c))
+        det = np.einsum('ijk,ijk->ij', a, np.cross(b, c))
+        dots = (len_a * len_b * len_c
+                + np.einsum('ijk,ijk->ij', a, b) * len_c
+                + np.einsum('ijk,ijk->ij', b, c) * len_a
+                + np.einsum('ijk,ijk->ij', c, a) * len_b)
+        winding[start:start + batch] = np.arctan2(det, dots).sum(axis=1) / (2 * np.pi)
+    return winding
+
+def orient_shells(mesh):
+    """
+    Orients the faces of a mesh with merged vertices in place so the slicing
+    kernels measure it correctly. Each shell (connected set of faces) is wound
+    consistently, then faces out if it lies inside an even number of other
+    shells, like an outer surface, or in if odd, like the wall of a void.
+    Faces are only rewritten when some shell needs fixing.
+    """
+    trimesh.repair.fix_winding(mesh)
+
+    labels = trimesh.graph.connected_component_labels(mesh.face_adjacency,
+                                                      node_count=len(mesh.faces))
+    num_shells = labels.max() + 1
+    triangles = mesh.triangles - mesh.bounds.mean(axis=0)
+
+    # Signed volume of every shell, positive when it faces out
+    face_volumes = np.einsum('ij,ij->i', triangles[:, 0],
+                             np.cross(triangles[:, 1], triangles[:, 2])) / 6
+    volumes = np.bincount(labels, weights=face_volumes, minlength=num_shells)
+
+    # Count the other shells around one vertex of each shell. Only shells
+    # whose bounding box holds that vertex can enclose it.
+    depths = np.zeros(num_shells, dtype=int)
+    if num_shells > 1:
+        order = np.argsort(labels, kind='stable')
+        starts = np.searchsorted(labels[order], np.arange(num_shells + 1))
+        points = triangles[order[starts[:-1]], 0]
+        for shell in range(num_shells):
+            shell_tris = triangles[order[starts[shell]:starts[shell + 1]]]
+            lower = shell_tris.min(axis=(0, 1))
+            upper = shell_tris.max(axis=(0, 1))
+            inside_box = np.all((points >= lower) & (points <= upper), axis=1)
+            inside_box[shell] = False
+            if inside_box.any():
+                winding = _shell_winding_numbers(shell_tris, points[inside_box])
+                depths[inside_box] += np.abs(winding) > 0.5
+
+    flip = (volumes > 0) != (depths % 2 == 0)
+    if flip[labels].any():
+        faces = mesh.faces.copy()
+        faces[flip[labels]] = faces[flip[labels], ::-1]
+        mesh.faces = faces
+
+def get_area_distribution(mesh, axis_idx, num_slices, single_precision=False, bounds=None):
+    """
+    Calculates the cross-sectional area distribution along the axis with index
+    axis_idx (0, 1 or 2 for X, Y or Z). The mesh's faces must be wound
+    consistently with outward normals, as trimesh.repair.fix_normals leaves them.
+    Set single_precision to slice in float32, which is faster on large models.
+    Pass the mesh's bounds if they are already known to skip recomputing them.
+    """
+    axis_name = "XYZ"[axis_idx]
     
     print(f"Analyzing geometry along {axis_name} axis...")
     
-    # Get the bounding box of the mesh
-    bounds = mesh.bounds
-    
     # Determine start and end points along the chosen axis
-    min_val = np.dot(bounds[0], axis_direction)
-    max_val = np.dot(bounds[1], axis_direction)
+    if bounds is None:
+        bounds = mesh.bounds
+    min_val, max_val = bounds[0, axis_idx], bounds[1, axis_idx]
     
     # Create the locations where we will slice
-    slice_locations = np.linspace(min_val, max_val, num_slices)
-    areas = []
+    slice_locations = _slice_locations(min_val, max_val, num_slices)
     
     print(f"Slicing model into {num_slices} sections along {axis_name}...")
 
-    for i, loc in enumerate(slice_locations):
-        # Calculate the origin point for this specific slice
-        origin = np.array(axis_direction) * loc
-        
-        # Slice the mesh
-        slice_2d = mesh.section(plane_origin=origin, plane_normal=axis_direction)
-        
-        if slice_2d:
-            # slice_2d is a Path3D, we need to convert it to a planar Path2D first
-            # We use to_2D() instead of to_planar() to avoid deprecation warnings
-            slice_planar, to_3D = slice_2d.to_2D()
-            areas.append(slice_planar.area)
-        else:
-            areas.append(0.0)
+    triangles, heights = _kernel_arrays(mesh.triangles, slice_locations, bounds, max_val,
+                                        single_precision)
+    areas = np.empty(num_slices)
+    if _areas_along_axis_numba is not None:
+        with _numba_lock:
+            _areas_along_axis_numba(triangles, axis_idx, heights, areas)
+    else:
+        _areas_along_axis(triangles, axis_idx, heights, areas)
             
-    # Shift locations to start at 0 for plotting
-    plot_locations = slice_locations - slice_locations[0]
+    # Measure locations from the start of the model for plotting
+    plot_locations = slice_locations - min_val
             
     return plot_locations, areas
 
+def iter_all_axes(mesh, num_slices, num_chunks=4, single_precision=False, bounds=None):
+    """
+    Calculates the cross-sectional area distributions along the X, Y and Z axes
+    in num_chunks consecutive runs of slices, each a single pass over the
+    triangles. After every run, yields the distributions computed so far in the
+    same form compute_all_axes returns. The mesh must be wound consistently,
+    as for get_area_distribution. Set single_precision to slice in
+    float32, which is faster on large models, and pass bounds if they are
+    already known.
+    """
+    print(f"Slicing model into {num_slices} sections along X, Y and Z...")
+
+    # One row of slice locations per axis, spanning the bounding box
+    if bounds is None:
+        bounds = mesh.bounds
+    slice_locations = np.ascontiguousarray(_slice_locations(bounds[0], bounds[1], num_slices))
+    triangles, heights = _kernel_arrays(mesh.triangles, slice_locations, bounds, bounds[1][:, None],
+                                        single_precision)
+
+    # Measure locations from the start of the model for plotting
+    plot_locations = slice_locations - bounds[0][:, None]
+
+    areas = np.empty((3, num_slices))
+    chunk_stops = np.linspace(0, num_slices, min(num_chunks, num_slices) + 1).round().astype(int)
+
+    for start, stop in zip(chunk_stops[:-1], chunk_stops[1:]):
+        chunk_heights = np.ascontiguousarray(heights[:, start:stop])
+        chunk_areas = np.empty((3, stop - start))
+        if _areas_all_axes_numba is not None:
+            with _numba_lock:
+                _areas_all_axes_numba(triangles, chunk_heights, chunk_areas)
+        else:
+            _areas_all_axes(triangles, chunk_heights, chunk_areas)
+        areas[:, start:stop] = chunk_areas
+
+        yield {axis_name: (plot_locations[i, :stop], areas[i, :stop])
+               for i, axis_name in enumerate("XYZ")}
+
+def compute_all_axes(mesh, num_slices, single_precision=False, bounds=None):
+    """
+    Calculates the cross-sectional area distributions along the X, Y and Z axes
+    in a single pass over the triangles. Set single_precision to slice in
+    float32, which is faster on large models, and pass bounds if they are
+    already known.
+    """
+    for data in iter_all_axes(mesh, num_slices, num_chunks=1,
+                              single_precision=single_precision, bounds=bounds):
+        pass
+    return data
+
 def get_stl_filename():
     # 1. Check command line arguments
     if len(sys.argv) > 1:
@@ -117,6 +394,11 @@ def get_unit():
         print("Invalid selection. Please try again.")
 
 def main():
+    # Plotting is only needed by the CLI, so importers such as the Streamlit
+    # app don't pay for loading matplotlib
+    import matplotlib.pyplot as plt
+    from matplotlib.widgets import Button
+
     filename = get_stl_filename()
     if not filename:
         return
@@ -126,26 +408,35 @@ def main():
 
     print(f"Loading {filename}...")
     try:
-        mesh = trimesh.load(filename)
+        mesh = trimesh.load(filename, process=False)
     except Exception as e:
         print(f"Error loading file: {e}")
         return
 
-    # If the file contains multiple objects, combine them into one mesh
+    # If the file contains multiple objects, combine them into one mesh.
+    # dump() places every instance with its node transform. A scene holding a
+    # single untransformed instance is used as is, which avoids copying all
+    # of its arrays.
     if isinstance(mesh, trimesh.Scene):
-        mesh = trimesh.util.concatenate(mesh.dump())
+        nodes = mesh.graph.nodes_geometry
+        if len(nodes) == 1 and np.allclose(mesh.graph[nodes[0]][0], np.eye(4)):
+            mesh = mesh.geometry[mesh.graph[nodes[0]][1]]
+        else:
+            mesh = trimesh.util.concatenate(mesh.dump())
+
+    # Loading skips trimesh's processing, which leaves every face with its own
+    # copy of its vertices. Merge them so neighbouring faces share edges again.
+    # Merging costs about as much as that processing did, and orienting the
+    # shells adds roughly two thirds on top, so a load is slower than a plain
+    # processed load. It is paid once per file.
+    mesh.merge_vertices()
+
+    # The areas are summed from signed outline segments, so flipped faces,
+    # inside-out bodies and void walls must be oriented consistently
+    orient_shells(mesh)
 
     # Calculate distributions for all 3 axes
-    data = {}
-    axes_config = {
-        'X': [1, 0, 0],
-        'Y': [0, 1, 0],
-        'Z': [0, 0, 1]
-    }
-
-    for axis_name, direction in axes_config.items():
-        locs, areas = get_area_distribution(mesh, direction, NUM_SLICES)
-        data[axis_name] = (locs, areas)
+    data = compute_all_axes(mesh, NUM_SLICES)
 
     # Plotting Setup
     print("Generating interactive graph...")
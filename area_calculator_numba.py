@@ -0,0 +1,126 @@
+"""
+Numba-compiled slicing kernels used by area_calculator when numba is installed.
+"""
+import numpy as np
+from numba import njit, prange
+
+# Number of triangle blocks the fused kernel splits its pass into. Each block
+# gets private accumulators, so this also bounds how many threads can help.
+_NUM_BLOCKS = 64
+
+@njit(cache=True, fastmath=True, inline='always')
+def _outline_term(tris, i, axis_idx, h, center):
+    """
+    Shoelace term of the section outline segment that the plane at height h
+    cuts from triangle i, or 0 if the triangle doesn't cross the plane. The
+    segment's direction, and so the term's sign, follows the face winding.
+    """
+    # In-plane coordinates, ordered so that (u, v, axis) is right-handed
+    u_idx = (axis_idx + 1) % 3
+    v_idx = (axis_idx + 2) % 3
+
+    # Walk the edges in winding order. The section outline runs from the
+    # edge leaving the region above the plane to the edge entering it.
+    start_u = start_v = end_u = end_v = 0.0
+    for k in range(3):
+        k_next = (k + 1) % 3
+        dist = tris[i, k, axis_idx] - h
+        dist_next = tris[i, k_next, axis_idx] - h
+        if (dist > 0) == (dist_next > 0):
+            continue
+
+        t = dist / (dist - dist_next)
+        pu = tris[i, k, u_idx] + t * (tris[i, k_next, u_idx] - tris[i, k, u_idx]) - center[u_idx]
+        pv = tris[i, k, v_idx] + t * (tris[i, k_next, v_idx] - tris[i, k, v_idx]) - center[v_idx]
+        if dist > 0:
+            start_u, start_v = pu, pv
+        else:
+            end_u, end_v = pu, pv
+
+    return start_u * end_v - start_v * end_u
+
+@njit(cache=True, fastmath=True, inline='always')
+def _add_triangle(tris, i, axis_idx, heights, center, sums):
+    """
+    Adds the outline terms of triangle i to the sums of the slices it crosses.
+    heights must be sorted.
+    """
+    z0 = tris[i, 0, axis_idx]
+    z1 = tris[i, 1, axis_idx]
+    z2 = tris[i, 2, axis_idx]
+
+    # Only the slices with z_min <= h < z_max cross this triangle
+    first = np.searchsorted(heights, min(z0, z1, z2))
+    last = np.searchsorted(heights, max(z0, z1, z2))
+    for s in range(first, last):
+        sums[s] += _outline_term(tris, i, axis_idx, heights[s], center)
+
+@njit(cache=True)
+def _vertex_mean(tris):
+    """Mean vertex position, used to center the shoelace sums."""
+    center = np.zeros(3)
+    num_tris = tris.shape[0]
+    for i in range(num_tris):
+        for k in range(3):
+            for c in range(3):
+                center[c] += tris[i, k, c]
+    if num_tris > 0:
+        center /= 3 * num_tris
+    return center
+
+@njit(cache=True, parallel=True, fastmath=True)
+def areas_along_axis(tris, axis_idx, heights, out):
+    """
+    Fills out with the cross-sectional areas at the given heights along a
+    coordinate axis, computed from the (n, 3, 3) triangle array of a closed mesh
+    with consistent, outward-facing winding. The heights must be sorted.
+    """
+    num_tris = tris.shape[0]
+    num_slices = heights.shape[0]
+    # Centering keeps the shoelace sums well conditioned far from the origin
+    center = _vertex_mean(tris)
+
+    # Each block of triangles accumulates into its own row so that blocks
+    # can run in parallel without sharing any output
+    num_blocks = max(1, min(num_tris, _NUM_BLOCKS))
+    block_size = (num_tris + num_blocks - 1) // num_blocks
+    partial = np.zeros((num_blocks, num_slices))
+
+    for b in prange(num_blocks):
+        for i in range(b * block_size, min((b + 1) * block_size, num_tris)):
+            _add_triangle(tris, i, axis_idx, heights, center, partial[b])
+
+    for s in range(num_slices):
+        total = 0.0
+        for b in range(num_blocks):
+            total += partial[b, s]
+        out[s] = abs(total) / 2
+
+@njit(cache=True, parallel=True, fastmath=True)
+def areas_all_axes(tris, heights, out):
+    """
+    Fills out with the cross-sectional areas along X, Y and Z in one pass over
+    the triangles of a consistently wound closed mesh. heights and out have one
+    row of slices per axis, and the slice heights in each row must be sorted.
+    """
+    num_tris = tris.shape[0]
+    num_slices = heights.shape[1]
+    center = _vertex_mean(tris)
+
+    # Each block of triangles accumulates into its own rows so that blocks
+    # can run in parallel without sharing any output
+    num_blocks = max(1, min(num_tris, _NUM_BLOCKS))
+    block_size = (num_tris + num_blocks - 1) // num_blocks
+    partial = np.zeros((num_blocks, 3, num_slices))
+
+    for b in prange(num_blocks):
+        for i in range(b * block_size, min((b + 1) * block_size, num_tris)):
+            for axis_idx in range(3):
+                _add_triangle(tris, i, axis_idx, heights[axis_idx], center, partial[b, axis_idx])
+
+    for axis_idx in range(3):
+        for s in range(num_slices):
+            total = 0.0
+            for b in range(num_blocks):
+                total += partial[b, axis_idx, s]
+            out[axis_idx, s] = abs(total) / 2
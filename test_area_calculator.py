@@ -0,0 +1,91 @@
+"""
+Checks the slicing kernels against trimesh's own cross sections.
+Run with: python -m unittest test_area_calculator
+"""
+import io
+import unittest
+from unittest import mock
+
+import numpy as np
+import trimesh
+
+import area_calculator
+
+NUM_SLICES = 15
+
+def load_as_stl(mesh):
+    """Round trips a mesh through an STL file and loads it like the app does."""
+    data = trimesh.exchange.stl.export_stl(mesh)
+    loaded = trimesh.load(io.BytesIO(data), file_type='stl', process=False)
+    loaded.merge_vertices()
+    area_calculator.orient_shells(loaded)
+    return loaded
+
+def section_areas(mesh, num_slices):
+    """Cross-sectional areas at the slice locations, from mesh.section."""
+    areas = {}
+    for axis_idx, axis_name in enumerate("XYZ"):
+        locations = area_calculator._slice_locations(mesh.bounds[0, axis_idx],
+                                                     mesh.bounds[1, axis_idx], num_slices)
+        axis_areas = []
+        for location in locations:
+            origin = np.zeros(3)
+            origin[axis_idx] = location
+            section = mesh.section(plane_origin=origin, plane_normal=np.eye(3)[axis_idx])
+            axis_areas.append(0.0 if section is None else section.to_2D()[0].area)
+        areas[axis_name] = np.array(axis_areas)
+    return areas
+
+def hollow_box():
+    outer = trimesh.creation.box([2, 2, 2])
+    void = trimesh.creation.box([1, 1, 1])
+    void.invert()
+    return trimesh.util.concatenate([outer, void])
+
+def flipped_sphere():
+    sphere = trimesh.creation.icosphere(subdivisions=3)
+    sphere.faces[:50] = sphere.faces[:50, ::-1]
+    return sphere
+
+class AreaDistributionTest(unittest.TestCase):
+
+    def assert_matches_sections(self, mesh, expected_mesh):
+        expected = section_areas(expected_mesh, NUM_SLICES)
+        loaded = load_as_stl(mesh)
+        # The NumPy kernel, then the Numba kernel if it is installed
+        kernels = [mock.patch.object(area_calculator, '_areas_all_axes_numba', None)]
+        if area_calculator._areas_all_axes_numba is not None:
+            kernels.append(mock.patch.object(area_calculator, '_areas_all_axes_numba',
+                                             area_calculator._areas_all_axes_numba))
+        for kernel in kernels:
+            with kernel:
+                data = area_calculator.compute_all_axes(loaded, NUM_SLICES)
+            for axis_name in "XYZ":
+                np.testing.assert_allclose(data[axis_name][1], expected[axis_name], atol=1e-4)
+
+    def test_hollow_box(self):
+        self.assert_matches_sections(hollow_box(), hollow_box())
+
+    def test_hollow_box_with_outward_void(self):
+        void = trimesh.creation.box([1, 1, 1])
+        mesh = trimesh.util.concatenate([trimesh.creation.box([2, 2, 2]), void])
+        self.assert_matches_sections(mesh, hollow_box())
+
+    def test_torus(self):
+        torus = trimesh.creation.torus(major_radius=2, minor_radius=0.5)
+        self.assert_matches_sections(torus, torus)
+
+    def test_flipped_faces(self):
+        self.assert_matches_sections(flipped_sphere(), trimesh.creation.icosphere(subdivisions=3))
+
+    def test_inverted_body(self):
+        sphere = trimesh.creation.icosphere(subdivisions=3)
+        moved = sphere.copy()
+        moved.apply_translation([3, 0, 0])
+        inverted = moved.copy()
+        inverted.invert()
+        self.assert_matches_sections(trimesh.util.concatenate([sphere, inverted]),
+                                     trimesh.util.concatenate([sphere, moved]))
+
+if __name__ == '__main__':
+    unittest.main()